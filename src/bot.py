@@ -1,26 +1,40 @@
+import asyncio
 import logging
 
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.request import HTTPXRequest
 
-from .config import TELEGRAM_BOT_TOKEN, LOG_LEVEL, USE_LLM, OLLAMA_MODEL, HTTP_PROXY
+from .config import TELEGRAM_BOT_TOKEN, LOG_LEVEL, USE_LLM, OLLAMA_MODEL, HTTP_PROXY, PLACEHOLDER_DELAY
 from .retriever import Retriever
-from .domain import is_relevant_question, is_recommendation_intent, extract_background_tags, detect_program_from_text
+from .domain import (
+    is_relevant_question,
+    is_recommendation_intent,
+    extract_background_tags,
+    detect_program_from_text,
+    detect_search_program,
+)
 from .recommender import recommend_electives
 from .llm import generate_rag_answer
+from .sender import MessageSender
 
 logger = logging.getLogger(__name__)
 
 
+def _sender(context: ContextTypes.DEFAULT_TYPE) -> MessageSender:
+    return context.application.bot_data["sender"]
+
+
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(
+    await _sender(context).reply(
+        update.message,
         "Привет! Я помогу разобраться с магистратурами ИТМО (AI и AI Product). Задай вопрос или используй /recommend."
     )
 
 
 async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(
+    await _sender(context).reply(
+        update.message,
         "Задай вопрос по программам: учебный план, дисциплины, треки. Для рекомендаций по выборным предметам используй /recommend и опиши свой бэкграунд."
     )
 
@@ -29,12 +43,12 @@ async def cmd_recommend(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     text = (update.message.text or "").replace("/recommend", "").strip()
     prog = detect_program_from_text(text) or "ai"
     tags = extract_background_tags(text)
-    recs = recommend_electives(tags, prog)
+    recs = recommend_electives(tags, prog, retriever=context.application.bot_data.get("retriever"))
     if not recs:
-        await update.message.reply_text("Пока не нашёл релевантные рекомендации для выборных дисциплин.")
+        await _sender(context).reply(update.message, "Пока не нашёл релевантные рекомендации для выборных дисциплин.")
         return
     reply = "\n\n".join([f"• {r}" for r in recs])
-    await update.message.reply_text(reply)
+    await _sender(context).reply(update.message, reply)
 
 
 def _format_snippets_fallback(results) -> str:
@@ -56,76 +70,90 @@ def _format_snippets_fallback(results) -> str:
 async def handle_question(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = (update.message.text or "").strip()
     if not query:
-        await update.message.reply_text("Пожалуйста, введите вопрос.")
+        await _sender(context).reply(update.message, "Пожалуйста, введите вопрос.")
         return
     
     logger.info(f"Processing question: {query}")
     retriever: Retriever = context.application.bot_data.get("retriever")
 
-    if not is_relevant_question(query, retriever):
+    # Score only the detected program's shard; fall back to the whole corpus if it has no good match
+    program = detect_search_program(query)
+    if program and not is_relevant_question(query, retriever, program=program):
+        logger.info(f"No relevant match within program {program}, searching all programs")
+        program = None
+    elif program:
+        logger.info(f"Restricting search to program: {program}")
+
+    if not program and not is_relevant_question(query, retriever):
         logger.info("Question not relevant to ITMO programs")
-        await update.message.reply_text("Я отвечаю только на вопросы по обучению на магистратурах AI и AI Product в ИТМО.")
+        await _sender(context).reply(update.message, "Я отвечаю только на вопросы по обучению на магистратурах AI и AI Product в ИТМО.")
         return
 
     if is_recommendation_intent(query):
         logger.info("Recommendation intent detected")
-        await update.message.reply_text("Похоже, нужны рекомендации по выборным. Используй команду /recommend и опиши свой бэкграунд и программу.")
+        await _sender(context).reply(update.message, "Похоже, нужны рекомендации по выборным. Используй команду /recommend и опиши свой бэкграунд и программу.")
         return
 
     try:
         logger.info("Searching for relevant information")
-        results = retriever.search(query, top_k=4)
+        results = retriever.search(query, top_k=4, program=program)
         if not results:
             logger.warning("No search results found")
-            await update.message.reply_text("Не нашёл релевантную информацию в учебных планах.")
+            await _sender(context).reply(update.message, "Не нашёл релевантную информацию в учебных планах.")
             return
 
         logger.info(f"Found {len(results)} search results")
+        logger.debug(f"Retriever cache: {retriever.cache_stats()}")
         
         # Try LLM if enabled
+        processing_msg = None
         if USE_LLM:
             logger.info("LLM is enabled, attempting generation")
-            
-            # Notify user that model is processing
-            processing_msg = await update.message.reply_text("🤖 ИИ-модель анализирует ваш вопрос и найденную информацию...")
-            
+            chunks = [r.text for r in results]
+            logger.info(f"Preparing {len(chunks)} chunks for LLM")
+
+            # Generate off the event loop; only show the placeholder if the answer is not ready quickly
+            generation = asyncio.ensure_future(asyncio.to_thread(generate_rag_answer, query, chunks))
+            done, _ = await asyncio.wait({generation}, timeout=PLACEHOLDER_DELAY)
+            if not done:
+                sent = await _sender(context).reply(update.message, "🤖 ИИ-модель анализирует ваш вопрос и найденную информацию...")
+                processing_msg = sent[0]
+
+            # Only generation failures fall back to snippets; send failures go to the outer handler
+            answer = None
             try:
-                chunks = [r.text for r in results]
-                logger.info(f"Preparing {len(chunks)} chunks for LLM")
-                
-                answer = generate_rag_answer(query, chunks)
+                answer = await generation
                 logger.info(f"LLM generated answer: {len(answer)} chars")
-                
+            except Exception as e:
+                logger.error(f"LLM generation failed: {e}", exc_info=True)
+                logger.warning("Falling back to snippets due to LLM failure")
+
+            if answer is not None:
                 # Append sources
                 urls = list(set(r.url for r in results))
                 if urls:
                     answer += "\n\n📖 Источники:\n" + "\n".join([f"• {u}" for u in urls])
-                
-                # Delete processing message and send answer
-                await processing_msg.delete()
-                await update.message.reply_text(answer)
+
+                # Turn the processing message into the answer, or reply directly on the fast path
+                if processing_msg is not None:
+                    await _sender(context).edit(processing_msg, answer)
+                else:
+                    await _sender(context).reply(update.message, answer)
                 logger.info("Successfully sent LLM answer")
                 return
-                
-            except Exception as e:
-                logger.error(f"LLM generation failed: {e}", exc_info=True)
-                logger.warning("Falling back to snippets due to LLM failure")
-                
-                # Update processing message to show fallback (ignore network errors)
-                try:
-                    await processing_msg.edit_text("🤖 ИИ-модель временно недоступна. Показываю найденную информацию:")
-                except Exception as edit_err:
-                    logger.warning(f"Failed to edit processing message: {edit_err}")
-
-        # Fallback: show formatted snippets
+
+        # Fallback: show formatted snippets, in place of the processing message if one was sent
         logger.info("Using fallback snippets")
         formatted = _format_snippets_fallback(results)
-        await update.message.reply_text(formatted)
+        if processing_msg is not None:
+            await _sender(context).edit(processing_msg, "🤖 ИИ-модель временно недоступна. Показываю найденную информацию:\n\n" + formatted)
+        else:
+            await _sender(context).reply(update.message, formatted)
         logger.info("Successfully sent fallback snippets")
         
     except Exception as e:
         logger.exception(f"Failed to process question: {e}")
-        await update.message.reply_text("Произошла ошибка при обработке запроса.")
+        await _sender(context).reply(update.message, "Произошла ошибка при обработке запроса.")
 
 
 def build_app(token: str) -> Application:
@@ -133,8 +161,10 @@ def build_app(token: str) -> Application:
         level=getattr(logging, LOG_LEVEL, logging.INFO),
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    # Configure Telegram HTTP client with timeouts and optional proxy
+    # Configure Telegram HTTP client with timeouts and optional proxy;
+    # MessageSender paces all outbound calls made through it
     request = HTTPXRequest(
+        connection_pool_size=8,
         proxy_url=HTTP_PROXY or None,
         connect_timeout=15.0,
         read_timeout=30.0,
@@ -142,6 +172,7 @@ def build_app(token: str) -> Application:
         pool_timeout=5.0,
     )
     app = Application.builder().token(token).request(request).build()
+    app.bot_data["sender"] = MessageSender()
 
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("help", cmd_help))
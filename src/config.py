@@ -18,6 +18,11 @@ HTTP_PROXY = os.getenv("HTTP_PROXY", "").strip()
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434").strip()
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:1b").strip()
 USE_LLM = os.getenv("USE_LLM", "true").lower() == "true"
+RETRIEVER_CACHE_SIZE = int(os.getenv("RETRIEVER_CACHE_SIZE", "256"))
+TELEGRAM_GLOBAL_RATE = int(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1.0"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+PLACEHOLDER_DELAY = float(os.getenv("PLACEHOLDER_DELAY", "1.5"))
 
 for directory in (DATA_DIR, RAW_DIR, PROCESSED_DIR):
     directory.mkdir(parents=True, exist_ok=True)
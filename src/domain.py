@@ -43,18 +43,33 @@ def extract_background_tags(text: str) -> List[str]:
     return tags
 
 
+# Any of these names AI Product; "ai" must be part of the match so a bare "ai" is left for the AI check
+_AI_PRODUCT_RE = re.compile(r"\bai[\s_-]*(?:product|продакт)|product|продакт")
+
+
 def detect_program_from_text(text: str) -> Optional[str]:
     t = text.lower()
-    if "ai product" in t or "ai_product" in t or "продакт" in t or "product" in t:
+    if _AI_PRODUCT_RE.search(t):
         return "ai_product"
     if re.search(r"\bai\b", t) or "искусствен" in t:
         return "ai"
     return None
 
 
-def is_relevant_question(text: str, retriever: Retriever, threshold: float = 0.08) -> bool:
+def detect_search_program(text: str) -> Optional[str]:
+    # Like detect_program_from_text, but a question naming both programs (e.g. a comparison)
+    # must search the whole corpus rather than one program's shard
+    program = detect_program_from_text(text)
+    if program == "ai_product":
+        t = _AI_PRODUCT_RE.sub(" ", text.lower())
+        if re.search(r"\bai\b", t) or "искусствен" in t:
+            return None
+    return program
+
+
+def is_relevant_question(text: str, retriever: Retriever, threshold: float = 0.08, program: Optional[str] = None) -> bool:
     # Use retriever scores to decide relevance
-    results = retriever.search(text, top_k=1)
+    results = retriever.search(text, top_k=1, program=program)
     if not results:
         return False
     return results[0].score >= threshold
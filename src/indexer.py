@@ -1,6 +1,7 @@
 from __future__ import annotations
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 import json
+import os
 from pathlib import Path
 
 import joblib
@@ -8,6 +9,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
 from .config import DOCUMENTS_PATH, INDEX_PATH
+from .utils import doc_program
 
 
 class TfidfRetrievalIndex:
@@ -25,6 +27,13 @@ class TfidfRetrievalIndex:
 
 def build_index() -> None:
     docs = json.loads(Path(DOCUMENTS_PATH).read_text(encoding="utf-8"))
+    # Keep each program's chunks contiguous so the retriever can score one program as a row slice
+    docs = sorted(docs, key=doc_program)
+    program_ranges: Dict[str, Tuple[int, int]] = {}
+    for row, doc in enumerate(docs):
+        start, _ = program_ranges.get(doc_program(doc), (row, row))
+        program_ranges[doc_program(doc)] = (start, row + 1)
+
     corpus = [d["text"] for d in docs]
     doc_ids = [d["id"] for d in docs]
 
@@ -37,14 +46,18 @@ def build_index() -> None:
     )
     document_vectors = vectorizer.fit_transform(corpus)
 
+    # Dump next to the index and swap it in, so a running bot never reads a half-written file
+    tmp_path = INDEX_PATH.with_name(INDEX_PATH.name + ".tmp")
     joblib.dump(
         {
             "vectorizer": vectorizer,
             "document_vectors": document_vectors,
             "document_ids": doc_ids,
+            "program_ranges": program_ranges,
         },
-        INDEX_PATH,
+        tmp_path,
     )
+    os.replace(tmp_path, INDEX_PATH)
 
 
 if __name__ == "__main__":
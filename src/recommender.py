@@ -1,9 +1,13 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Dict, Optional, TYPE_CHECKING
 import json
 from pathlib import Path
 
 from .config import DOCUMENTS_PATH
+from .utils import doc_program
+
+if TYPE_CHECKING:
+    from .retriever import Retriever
 
 
 def load_all_texts() -> List[Dict]:
@@ -11,13 +15,18 @@ def load_all_texts() -> List[Dict]:
 
 
 def filter_docs_by_program(docs: List[Dict], program: str) -> List[Dict]:
-    # program in our pipeline is part of the id/title slug
-    return [d for d in docs if program in d.get("title", "") or program in d.get("id", "") or program in d.get("url", "")]
-
-
-def recommend_electives(background_tags: List[str], program: str, top_k: int = 6) -> List[str]:
-    docs = load_all_texts()
-    docs = filter_docs_by_program(docs, program)
+    # Exact slug match: a substring test would let "ai" also pick up "ai_product"
+    return [d for d in docs if doc_program(d) == program]
+
+
+def recommend_electives(
+    background_tags: List[str], program: str, top_k: int = 6, retriever: Optional["Retriever"] = None
+) -> List[str]:
+    # The retriever already holds the corpus partitioned by program; fall back to disk without it
+    if retriever is not None:
+        docs = retriever.program_docs(program)
+    else:
+        docs = filter_docs_by_program(load_all_texts(), program)
 
     # Simple keyword heuristics: score chunks that mention elective/выбор/треки and match bg tags
     KEYWORDS = ["выбор", "электив", "модуль", "трек", "курс", "дисциплин", "каталог"]
@@ -1,13 +1,18 @@
 from __future__ import annotations
 import json
+import logging
+import re
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Dict, Hashable, List, Optional, Tuple
 
 import joblib
 
-from .config import INDEX_PATH, DOCUMENTS_PATH
+from .config import INDEX_PATH, DOCUMENTS_PATH, RETRIEVER_CACHE_SIZE
+from .utils import doc_program
 
+logger = logging.getLogger(__name__)
 
 @dataclass
 class RetrievedChunk:
@@ -18,28 +23,210 @@ class RetrievedChunk:
     score: float
 
 
+@dataclass
+class _Shard:
+    document_ids: List[str]
+    document_vectors: object
+    row_norms: object
+
+
+@dataclass
+class _CacheEntry:
+    index_version: int
+    value: object
+
+
+def normalize_query(text: str) -> str:
+    # The vectorizer lowercases and tokenizes on \w, so case, punctuation and
+    # extra whitespace do not change the query vector and can be folded away.
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class QueryCache:
+    """Size-bounded LRU whose entries are dropped once the index version changes."""
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, index_version: int) -> Optional[object]:
+        entry = self._entries.get(key)
+        if entry is None or entry.index_version != index_version:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def put(self, key: Hashable, value: object, index_version: int) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[key] = _CacheEntry(index_version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
 class Retriever:
-    def __init__(self) -> None:
+    # Rankings are cached a bit deeper than usually requested so that the
+    # relevance check (top_k=1) and the answer search (top_k=4) share an entry.
+    CACHED_TOP_K = 8
+
+    def __init__(self, cache_size: int = RETRIEVER_CACHE_SIZE) -> None:
+        # Query vectors do not depend on the program filter, rankings do
+        self.vector_cache = QueryCache(cache_size)
+        self.ranking_cache = QueryCache(cache_size)
+        self.index_version = -1
+        self._failed_version = -1
+        self._load()
+
+    def _load(self) -> None:
+        # Everything is loaded into locals first and swapped in at the end,
+        # so a failed load leaves the previous index fully intact
+        version = Path(INDEX_PATH).stat().st_mtime_ns
         payload = joblib.load(INDEX_PATH)
-        self.vectorizer = payload["vectorizer"]
-        self.document_vectors = payload["document_vectors"]
-        self.document_ids = payload["document_ids"]
+        document_vectors = payload["document_vectors"]
+        document_ids = payload["document_ids"]
         docs = json.loads(Path(DOCUMENTS_PATH).read_text(encoding="utf-8"))
-        self.id_to_doc = {d["id"]: d for d in docs}
+        id_to_doc = {d["id"]: d for d in docs}
+        shards = self._build_shards(document_ids, document_vectors, id_to_doc, payload.get("program_ranges"))
+
+        self.vectorizer = payload["vectorizer"]
+        self.document_vectors = document_vectors
+        self.document_ids = document_ids
+        self.id_to_doc = id_to_doc
+        self.shards = shards
+        self.index_version = version
+        self.vector_cache.clear()
+        self.ranking_cache.clear()
+
+    @staticmethod
+    def _make_shard(document_ids: List[str], mat) -> _Shard:
+        import numpy as np
+
+        row_norms = np.sqrt(mat.multiply(mat).sum(axis=1)).A1
+        return _Shard(document_ids, mat, row_norms)
+
+    @staticmethod
+    def _row_view(mat, start: int, end: int):
+        # CSR rows [start, end) sharing the parent's data/indices arrays; only indptr is new
+        from scipy.sparse import csr_matrix
+
+        lo, hi = mat.indptr[start], mat.indptr[end]
+        return csr_matrix(
+            (mat.data[lo:hi], mat.indices[lo:hi], mat.indptr[start:end + 1] - lo),
+            shape=(end - start, mat.shape[1]),
+            copy=False,
+        )
 
-    def search(self, query: str, top_k: int = 5) -> List[RetrievedChunk]:
-        query_vec = self.vectorizer.transform([query])
-        # Cosine sim from sklearn is expensive to import again; compute manually via dot
+    @classmethod
+    def _build_shards(
+        cls,
+        document_ids: List[str],
+        document_vectors,
+        id_to_doc: Dict[str, Dict],
+        program_ranges: Optional[Dict[str, Tuple[int, int]]],
+    ) -> Dict[Optional[str], _Shard]:
+        # None is the whole corpus (no copy of the matrix); other keys are program slugs
+        shards: Dict[Optional[str], _Shard] = {None: cls._make_shard(document_ids, document_vectors)}
+        if program_ranges:
+            for program, (start, end) in program_ranges.items():
+                shards[program] = cls._make_shard(document_ids[start:end], cls._row_view(document_vectors, start, end))
+            return shards
+        # Index built before partitioning: rows are not contiguous, so group them by program
+        # from document metadata (this copies the rows; rebuild the index to avoid it)
+        rows_by_program: Dict[str, List[int]] = {}
+        for row, doc_id in enumerate(document_ids):
+            meta = id_to_doc.get(doc_id)
+            if meta:
+                rows_by_program.setdefault(doc_program(meta), []).append(row)
+        for program, rows in rows_by_program.items():
+            shards[program] = cls._make_shard([document_ids[i] for i in rows], document_vectors[rows])
+        return shards
+
+    def program_docs(self, program: str) -> List[Dict]:
+        shard = self.shards.get(program)
+        if shard is None:
+            return []
+        return [self.id_to_doc[doc_id] for doc_id in shard.document_ids if doc_id in self.id_to_doc]
+
+    def reload_if_changed(self) -> bool:
+        """Reload the index if the file on disk was rebuilt; stale cache entries are dropped.
+
+        A failed reload is logged and the current index keeps serving.
+        """
+        try:
+            version = Path(INDEX_PATH).stat().st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Cannot stat index, keeping the current one: {e}")
+            return False
+        # Don't retry a file that already failed until it is written again
+        if version in (self.index_version, self._failed_version):
+            return False
+        try:
+            self._load()
+        except Exception as e:
+            logger.error(f"Failed to reload index, keeping the current one: {e}")
+            self._failed_version = version
+            return False
+        return True
+
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        return {"vectors": self.vector_cache.stats(), "rankings": self.ranking_cache.stats()}
+
+    def _rank(self, query_vec, top_k: int, shard: _Shard) -> List[Tuple[str, float]]:
+        # Cosine sim from sklearn is expensive to import again; compute manually via dot.
+        # The query stays sparse so the cost follows the shard's nonzeros, not the vocabulary size.
         import numpy as np
-        from numpy.linalg import norm
 
-        q = query_vec.toarray()[0]
-        mat = self.document_vectors
-        sims = (mat @ q) / (norm(q) * np.sqrt((mat.multiply(mat)).sum(axis=1)).A1 + 1e-12)
-        pairs = list(zip(self.document_ids, sims))
+        q_norm = np.sqrt(np.square(query_vec.data).sum())
+        dots = (shard.document_vectors @ query_vec.T).toarray().ravel()
+        sims = dots / (q_norm * shard.row_norms + 1e-12)
+        pairs = list(zip(shard.document_ids, sims))
         pairs.sort(key=lambda x: x[1], reverse=True)
+        return [(doc_id, float(score)) for doc_id, score in pairs[:top_k]]
+
+    def search(self, query: str, top_k: int = 5, program: Optional[str] = None) -> List[RetrievedChunk]:
+        """Rank chunks for the query; with program= only that program's shard is scored.
+
+        Unknown programs fall back to the whole corpus.
+        """
+        # A stat call is cheap next to scoring and picks up a rebuilt index without a restart
+        self.reload_if_changed()
+        if program not in self.shards:
+            program = None
+        shard = self.shards[program]
+        text_key = normalize_query(query)
+        ranking_key = (program, text_key)
+        ranked = self.ranking_cache.get(ranking_key, self.index_version)
+        if ranked is None or (top_k > len(ranked) and len(ranked) < len(shard.document_ids)):
+            query_vec = self.vector_cache.get(text_key, self.index_version)
+            if query_vec is None:
+                query_vec = self.vectorizer.transform([query])
+                self.vector_cache.put(text_key, query_vec, self.index_version)
+            ranked = self._rank(query_vec, max(top_k, self.CACHED_TOP_K), shard)
+            self.ranking_cache.put(ranking_key, ranked, self.index_version)
+
         results: List[RetrievedChunk] = []
-        for doc_id, score in pairs[:top_k]:
+        for doc_id, score in ranked[:top_k]:
             meta = self.id_to_doc.get(doc_id)
             if not meta:
                 continue
@@ -49,7 +236,7 @@ class Retriever:
                     url=meta["url"],
                     title=meta.get("title", doc_id),
                     text=meta["text"],
-                    score=float(score),
+                    score=score,
                 )
             )
         return results
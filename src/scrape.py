@@ -58,6 +58,7 @@ def main() -> None:
                     "id": f"{slug}-{idx}",
                     "url": url,
                     "title": slug,
+                    "program": slug,
                     "text": chunk,
                 }
             )
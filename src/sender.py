@@ -0,0 +1,137 @@
+from __future__ import annotations
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, TypeVar
+import asyncio
+import logging
+import time
+
+from telegram import Message
+from telegram.constants import MessageLimit
+from telegram.error import RetryAfter
+
+from .config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, TELEGRAM_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def split_message(text: str, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> List[str]:
+    """Split text into Telegram-sized parts, preferring paragraph, line and word boundaries.
+
+    Blank parts are dropped, so whitespace-only text yields an empty list.
+    """
+    parts: List[str] = []
+    while len(text) > limit:
+        window = text[:limit]
+        cut = -1
+        for sep in ("\n\n", "\n", " "):
+            cut = window.rfind(sep)
+            if cut > limit // 2:
+                break
+        if cut <= limit // 2:
+            cut = limit
+        part = text[:cut].rstrip()
+        if part:
+            parts.append(part)
+        text = text[cut:].lstrip()
+    if text.strip():
+        parts.append(text)
+    return parts
+
+
+@dataclass
+class _ChatState:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_sent: float = 0.0
+    pending: int = 0
+
+
+class MessageSender:
+    """Outbound Telegram calls with global and per-chat rate limits and RetryAfter handling.
+
+    All calls go through the bot's shared HTTPXRequest; this class only decides when they run.
+    """
+
+    def __init__(
+        self,
+        global_rate: int = TELEGRAM_GLOBAL_RATE,
+        chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+    ) -> None:
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self._global_lock = asyncio.Lock()
+        self._recent: Deque[float] = deque()
+        self._chats: Dict[int, _ChatState] = {}
+        self._paused_until = 0.0
+
+    async def _wait_global(self) -> None:
+        async with self._global_lock:
+            while True:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                while self._recent and now - self._recent[0] >= 1.0:
+                    self._recent.popleft()
+                if len(self._recent) < self.global_rate:
+                    self._recent.append(now)
+                    return
+                await asyncio.sleep(1.0 - (now - self._recent[0]))
+
+    def _prune_chats(self) -> None:
+        # Forget chats with nothing queued whose interval has passed, so the map stays bounded
+        now = time.monotonic()
+        idle = [
+            chat_id
+            for chat_id, state in self._chats.items()
+            if state.pending == 0 and now - state.last_sent >= self.chat_interval
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def _call(self, chat_id: int, func: Callable[[], Awaitable[T]]) -> T:
+        self._prune_chats()
+        state = self._chats.setdefault(chat_id, _ChatState())
+        state.pending += 1
+        try:
+            async with state.lock:
+                for attempt in range(self.max_retries + 1):
+                    delay = state.last_sent + self.chat_interval - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    await self._wait_global()
+                    try:
+                        result = await func()
+                    except RetryAfter as e:
+                        if attempt == self.max_retries:
+                            raise
+                        logger.warning(f"Flood limit hit in chat {chat_id}, retrying in {e.retry_after}s")
+                        # Telegram's limit is per bot, so hold back every chat, not just this one
+                        self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                        await asyncio.sleep(e.retry_after)
+                        continue
+                    state.last_sent = time.monotonic()
+                    return result
+        finally:
+            state.pending -= 1
+        raise RuntimeError("Unreachable")
+
+    async def reply(self, message: Message, text: str) -> List[Message]:
+        if not text.strip():
+            raise ValueError("Refusing to send a blank message")
+        sent: List[Message] = []
+        for part in split_message(text):
+            sent.append(await self._call(message.chat_id, lambda part=part: message.reply_text(part)))
+        return sent
+
+    async def edit(self, message: Message, text: str) -> None:
+        if not text.strip():
+            raise ValueError("Refusing to send a blank message")
+        parts = split_message(text)
+        await self._call(message.chat_id, lambda: message.edit_text(parts[0]))
+        for part in parts[1:]:
+            await self._call(message.chat_id, lambda part=part: message.reply_text(part))
@@ -1,6 +1,6 @@
 import re
 import time
-from typing import Optional
+from typing import Dict, Optional
 import requests
 
 
@@ -42,3 +42,8 @@ def clean_text(text: str) -> str:
             seen.add(ln)
             unique_lines.append(ln)
     return "\n".join(unique_lines).strip()
+
+
+def doc_program(doc: Dict) -> str:
+    # Program slug of a chunk; older documents.json files only carry it in the title
+    return doc.get("program") or doc.get("title", "")